@@ -1,30 +1,127 @@
 # main.py
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from openai import OpenAI
+from openai import AsyncOpenAI, RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+from tenacity import retry, wait_random_exponential, stop_after_attempt, retry_if_exception
+from aiolimiter import AsyncLimiter
 import os
 from dotenv import load_dotenv
 import base64
-import uuid
-from datetime import datetime
-from typing import Dict, Any, List, Optional
+import secrets
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, AsyncIterator, Tuple, Union
 import json
 import re
+import asyncio
+from contextlib import asynccontextmanager
+import httpx
+import io
+from PIL import Image, ImageOps
+import hashlib
+from cachetools import TTLCache
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# Shared HTTP/2 connection pool for OpenAI calls, so concurrent requests reuse warm TLS connections
+http_client = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+    timeout=httpx.Timeout(60.0, connect=5.0)
+)
+
+# Initialize OpenAI client (module-level so the connection pool is reused across requests).
+# Retries are handled by create_chat_completion, so the SDK's own retries are disabled
+client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0, http_client=http_client)
+
+# Throttle OpenAI calls to stay under the account's requests-per-minute limit
+OPENAI_RPM_LIMIT = int(os.getenv('OPENAI_RPM_LIMIT', '500'))
+OPENAI_MAX_ATTEMPTS = int(os.getenv('OPENAI_MAX_ATTEMPTS', '5'))
+openai_rate_limiter = AsyncLimiter(OPENAI_RPM_LIMIT, 60)
+
+# Vision model for requests with images, faster/cheaper model for text-only requests
+VISION_MODEL = os.getenv('VISION_MODEL', 'gpt-4o')
+TEXT_MODEL = os.getenv('TEXT_MODEL', 'gpt-4o-mini')
+
+# Output token cap; the JSON response is normally well under 300 tokens.
+# A truncated response is retried once with the larger cap.
+MAX_OUTPUT_TOKENS = 400
+MAX_OUTPUT_TOKENS_ON_TRUNCATION = 1000
+
+# Parsers for model output
+_JSON_DECODER = json.JSONDecoder()
+_DIGITS_RE = re.compile(r'\d+')
+
+# Upload limits
+MAX_IMAGES = 10
+MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB per image
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Larger images are downscaled before upload; the vision model resizes to this range anyway
+MAX_IMAGE_DIMENSION = 1568
+JPEG_QUALITY = 85
+# Images above this pixel count are sent unchanged rather than decoded, to bound memory per file
+MAX_DOWNSCALE_PIXELS = 40_000_000
+# Whole request body limit: all images plus room for form fields and multipart overhead
+MAX_REQUEST_SIZE = MAX_IMAGES * MAX_FILE_SIZE + 1024 * 1024
+
+# Cache of ready-to-send image content items keyed by (MIME type, SHA-256 of the raw bytes),
+# bounded by total data URL size (per worker process) so large uploads cannot exhaust memory
+IMAGE_CONTENT_CACHE_MB = int(os.getenv('IMAGE_CONTENT_CACHE_MB', '64'))
+IMAGE_CONTENT_CACHE = TTLCache(
+    maxsize=IMAGE_CONTENT_CACHE_MB * 1024 * 1024,
+    ttl=3600,
+    getsizeof=lambda item: len(item["image_url"]["url"])
+)
+
+# Cache of successful analyses keyed by (images digests, description).
+# Shared across workers in Redis when REDIS_URL is set, otherwise kept in-process.
+ANALYSIS_CACHE_TTL = int(os.getenv('ANALYSIS_CACHE_TTL', '86400'))
+REDIS_URL = os.getenv('REDIS_URL')
+# Short timeouts so a stalled Redis falls back to a cache miss instead of blocking requests
+redis_client = aioredis.from_url(
+    REDIS_URL,
+    socket_connect_timeout=0.5,
+    socket_timeout=0.5
+) if REDIS_URL else None
+ANALYSIS_CACHE = TTLCache(maxsize=512, ttl=ANALYSIS_CACHE_TTL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Close the shared OpenAI connection pool and Redis connection on shutdown"""
+    yield
+    await http_client.aclose()
+    if redis_client is not None:
+        await redis_client.aclose()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="FixMe AI Repair Assistant",
     description="AI-powered image analysis for repair and maintenance issues",
-    version="4.0.0"
+    version="4.0.0",
+    lifespan=lifespan
 )
 
+# Registered before CORS so CORS wraps it and the 413 response carries CORS headers
+@app.middleware("http")
+async def limit_request_size(request: Request, call_next):
+    """Reject oversize request bodies before they are parsed"""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_REQUEST_SIZE:
+        return JSONResponse(
+            status_code=413,
+            content={
+                "error": "Request too large",
+                "message": f"Request body exceeds {MAX_REQUEST_SIZE/1024/1024:.0f}MB",
+                "success": False
+            }
+        )
+    return await call_next(request)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -34,47 +131,313 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Updated System prompt with confidence score requirement
-SYSTEM_PROMPT = """
-You are a professional repair and maintenance diagnostic assistant. 
-Analyze the provided information (images and/or text description) to identify what needs to be fixed.
-
-Consider:
-1. If images are provided, analyze them as different angles or aspects of the same problem
-2. If text description is provided, use it for context about the issue
-3. Provide ONE comprehensive analysis that covers all provided information
-4. Assess your own confidence level in the diagnosis
-
-Respond STRICTLY in the following JSON format:
-{
-    "detected_issue": "Brief title of the main issue",
-    "severity": "Low/Medium/High Severity",
-    "description": "Detailed explanation of the issue, including likely causes and immediate recommendations",
-    "estimated_price": {
-        "low": 0,
-        "high": 0
-    },
-    "confidence": 85
-}
-
-Guidelines:
-1. Analyze the information provided (images and/or description)
-2. If multiple issues are present, prioritize the most critical/severe one
-3. Be specific and accurate about the issues
-4. Assess overall severity based on potential damage, safety risks, and urgency
-5. Provide realistic price estimates in USD that cover fixing ALL identified issues
-6. If images are unclear, use the description for better context
-7. Price should be comprehensive for all repairs needed
-8. Provide a confidence score (0-100) representing how confident you are in this diagnosis
-   - Consider image clarity, description detail, and your certainty
-   - 90-100: Very high confidence (clear visual evidence and detailed description)
-   - 70-89: High confidence (good evidence but some ambiguity)
-   - 50-69: Medium confidence (reasonable evidence but could be multiple possibilities)
-   - 30-49: Low confidence (limited or unclear information)
-   - 0-29: Very low confidence (insufficient or contradictory information)
+# System prompt, kept short since it is sent with every request.
+# Keep it identical across calls so OpenAI's automatic prompt caching applies.
+# The full confidence rubric is documented in the root endpoint's accuracy_scale.
+SYSTEM_PROMPT = """You are a professional repair and maintenance diagnostic assistant.
+Images (if any) show the same problem from different angles; use the text description (if any) as context.
+Give ONE analysis of the most critical issue. Severity reflects damage, safety risk and urgency.
+Price is a realistic USD range covering all needed repairs.
+Respond only with JSON:
+{"detected_issue": "brief title", "severity": "Low Severity|Medium Severity|High Severity", "description": "issue, likely causes, immediate recommendations (under 80 words)", "estimated_price": {"low": 0, "high": 0}, "confidence": 0-100}
+Confidence bands: 90-100 clear evidence and detail; 70-89 some ambiguity; 50-69 several possibilities; 30-49 limited/unclear info; 0-29 insufficient or contradictory.
 """
 
-def analyze_with_openai(
+# Fingerprint of the system prompt, part of the analysis cache key
+SYSTEM_PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode('utf-8')).hexdigest()[:16]
+
+def is_retryable_openai_error(error: BaseException) -> bool:
+    """
+    Return True for transient OpenAI errors worth retrying.
+    Quota exhaustion is also a 429 RateLimitError but will not clear by waiting.
+    """
+    if isinstance(error, RateLimitError):
+        return getattr(error, 'code', None) != 'insufficient_quota'
+    return isinstance(error, (APITimeoutError, APIConnectionError, InternalServerError))
+
+@retry(
+    wait=wait_random_exponential(min=1, max=30),
+    stop=stop_after_attempt(OPENAI_MAX_ATTEMPTS),
+    retry=retry_if_exception(is_retryable_openai_error),
+    reraise=True
+)
+async def create_chat_completion(**kwargs: Any) -> Any:
+    """
+    Call the chat completions API, throttled and retried with exponential backoff on transient errors.
+    """
+    async with openai_rate_limiter:
+        return await client.chat.completions.create(**kwargs)
+
+def generate_request_id() -> str:
+    """
+    Generate a short (8 hex chars) request ID.
+    """
+    return secrets.token_hex(4)
+
+def format_timestamp(timestamp: float) -> str:
+    """
+    Format a Unix timestamp as an ISO 8601 UTC string.
+    """
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+def build_image_content(img_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the image_url content item for an image, reusing the cached one when the same image was sent before.
+    """
+    digest = img_data.get('digest')
+    cache_key = (img_data['mime_type'], digest) if digest else None
+    if cache_key:
+        cached_item = IMAGE_CONTENT_CACHE.get(cache_key)
+        if cached_item is not None:
+            return cached_item
+    
+    # Encode straight into the data URL bytes to avoid extra copies of large images
+    prefix = f"data:{img_data['mime_type']};base64,".encode('ascii')
+    url = (prefix + base64.b64encode(memoryview(img_data['content']))).decode('ascii')
+    item = {
+        "type": "image_url",
+        "image_url": {
+            "url": url
+        }
+    }
+    
+    # Skip caching when disabled or when the item alone exceeds the cache size
+    if cache_key and len(url) <= IMAGE_CONTENT_CACHE.maxsize:
+        IMAGE_CONTENT_CACHE[cache_key] = item
+    return item
+
+def build_analysis_cache_key(
+    images_data: List[Dict[str, Any]],
+    user_description: Optional[str] = None
+) -> Optional[str]:
+    """
+    Build the analysis cache key from the image digests and the description.
+    Returns None if any image has no digest.
+    """
+    digests = [img_data.get('digest') for img_data in images_data]
+    if not all(digests):
+        return None
+    
+    # Include the model and prompt so changing either doesn't serve stale analyses
+    model = VISION_MODEL if images_data else TEXT_MODEL
+    key_parts = [model.encode('utf-8'), SYSTEM_PROMPT_VERSION.encode('ascii')]
+    key_parts.extend(digest.encode('ascii') for digest in sorted(digests))
+    key_parts.append((user_description or "").encode('utf-8'))
+    return "fixme:" + hashlib.blake2b(b"|".join(key_parts), digest_size=16).hexdigest()
+
+async def get_cached_analysis(cache_key: Optional[str], user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Return a cached analysis with fresh per-request metadata, or None on a cache miss.
+    """
+    if cache_key is None:
+        return None
+    
+    if redis_client is not None:
+        try:
+            cached_value = await redis_client.get(cache_key)
+            cached_result = json.loads(cached_value) if cached_value else None
+        except (RedisError, json.JSONDecodeError):
+            # Treat an unavailable cache or a corrupt entry as a miss
+            cached_result = None
+    else:
+        cached_result = ANALYSIS_CACHE.get(cache_key)
+    
+    if not isinstance(cached_result, dict):
+        return None
+    
+    result = dict(cached_result)
+    result["user_id"] = user_id
+    result["request_id"] = generate_request_id()
+    result["analysis_timestamp"] = format_timestamp(time.time())
+    return result
+
+async def store_cached_analysis(cache_key: Optional[str], analysis_result: Dict[str, Any]) -> None:
+    """
+    Store a successful analysis in the cache.
+    """
+    if cache_key is None:
+        return
+    
+    if redis_client is not None:
+        try:
+            await redis_client.setex(cache_key, ANALYSIS_CACHE_TTL, json.dumps(analysis_result))
+        except RedisError:
+            # Caching is best-effort; the analysis itself succeeded
+            pass
+    else:
+        ANALYSIS_CACHE[cache_key] = dict(analysis_result)
+
+def build_messages(
+    images_data: List[Dict[str, Any]],
+    user_id: str,
+    user_description: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Build the chat messages (system prompt + user content) for the analysis request.
+    """
+    # Prepare the text prompt with clear instruction about confidence
+    text_prompt = f"Analyze this repair issue and provide a confidence score (0-100). User ID: {user_id}"
+    
+    if user_description and user_description.strip():
+        text_prompt += f"\n\nUser Description:\n{user_description}"
+    
+    # Add information about what was provided
+    if images_data:
+        text_prompt += f"\n\nNumber of images provided: {len(images_data)}"
+    else:
+        text_prompt += "\n\nNo images provided - analysis based on text description only."
+    
+    if not user_description or not user_description.strip():
+        text_prompt += "\n\nNo text description provided - analysis based on images only."
+    
+    if images_data:
+        # Prepare content array for OpenAI
+        content_items = [{"type": "text", "text": text_prompt}]
+        
+        # Add each image to the content
+        for img_data in images_data:
+            content_items.append(build_image_content(img_data))
+        user_content = content_items
+    else:
+        # Use plain text for text-only analysis
+        user_content = text_prompt
+    
+    return [
+        {
+            "role": "system",
+            "content": SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": user_content
+        }
+    ]
+
+def extract_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Decode the JSON object starting at the first '{' in text.
+    Uses a single raw_decode pass, which avoids regex backtracking on long responses.
+    Returns None if there is no '{' or the object there is incomplete or invalid.
+    """
+    start = text.find('{')
+    if start == -1:
+        return None
+    try:
+        obj, _ = _JSON_DECODER.raw_decode(text, start)
+    except json.JSONDecodeError:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+def build_analysis_result(
+    result_text: str,
+    images_data: List[Dict[str, Any]],
+    user_id: str,
+    user_description: Optional[str],
+    request_id: str
+) -> Tuple[Dict[str, Any], bool]:
+    """
+    Parse the raw model output and wrap it in the response envelope.
+    Returns (envelope, parsed); parsed is False if the fallback error analysis was used.
+    """
+    result_text = result_text or ""
+    
+    # JSON mode returns a bare object, so parse it directly
+    try:
+        analysis_result = json.loads(result_text)
+    except json.JSONDecodeError:
+        # Fallback: extract JSON embedded in surrounding text
+        analysis_result = extract_json_object(result_text)
+    
+    # A reply without detected_issue is not an analysis (e.g. a truncated or unrelated object)
+    parsed = isinstance(analysis_result, dict) and "detected_issue" in analysis_result
+    if not parsed:
+        # Create a structured error response
+        analysis_result = {
+            "detected_issue": "Analysis Error",
+            "severity": "Medium Severity",
+            "description": "Unable to parse AI response. Please try again with clearer information.",
+            "estimated_price": {"low": 0, "high": 0},
+            "confidence": 0
+        }
+    
+    # Validate confidence score
+    confidence = analysis_result.get("confidence", 0)
+    
+    # Ensure confidence is a number between 0 and 100
+    if isinstance(confidence, str):
+        # Try to extract number from string
+        numbers = _DIGITS_RE.findall(confidence)
+        if numbers:
+            confidence = int(numbers[0])
+        else:
+            confidence = 50  # Default if can't parse
+    elif not isinstance(confidence, (int, float)):
+        confidence = 50
+    
+    # Clamp confidence between 0 and 100
+    confidence = max(0, min(100, int(confidence)))
+    
+    # Build the final response
+    result_with_metadata = {
+        "user_id": user_id,
+        "detected_issue": analysis_result.get("detected_issue", "Unknown Issue"),
+        "severity": analysis_result.get("severity", "Medium Severity"),
+        "description": analysis_result.get("description", "No description provided"),
+        "estimated_price": analysis_result.get("estimated_price", {"low": 0, "high": 0}),
+        "accuracy": confidence,  # This is the confidence score
+        "success": True,
+        "request_id": request_id,
+        "analysis_timestamp": format_timestamp(time.time()),
+        "images_analyzed": len(images_data),
+        "has_user_description": user_description is not None and len(user_description.strip()) > 0
+    }
+    
+    return result_with_metadata, parsed
+
+def build_error_response(error: Exception, user_id: str, request_id: str) -> Dict[str, Any]:
+    """
+    Map an OpenAI API error to the error response envelope.
+    """
+    error_msg = str(error)
+    
+    if "rate_limit" in error_msg.lower():
+        return {
+            "user_id": user_id,
+            "detected_issue": "Service Error",
+            "severity": "Low Severity",
+            "description": "Rate limit exceeded. Please try again later.",
+            "estimated_price": {"low": 0, "high": 0},
+            "accuracy": 0,
+            "request_id": request_id,
+            "success": False,
+            "error_message": "Rate limit exceeded"
+        }
+    elif "invalid_api_key" in error_msg.lower():
+        return {
+            "user_id": user_id,
+            "detected_issue": "Service Error",
+            "severity": "Low Severity",
+            "description": "Server configuration issue. Please contact support.",
+            "estimated_price": {"low": 0, "high": 0},
+            "accuracy": 0,
+            "request_id": request_id,
+            "success": False,
+            "error_message": "Authentication error"
+        }
+    else:
+        return {
+            "user_id": user_id,
+            "detected_issue": "Analysis Failed",
+            "severity": "Low Severity",
+            "description": f"AI analysis failed: {error_msg}",
+            "estimated_price": {"low": 0, "high": 0},
+            "accuracy": 0,
+            "request_id": request_id,
+            "success": False,
+            "error_message": error_msg
+        }
+
+async def analyze_with_openai(
     images_data: List[Dict[str, Any]],
     user_id: str,
     user_description: Optional[str] = None
@@ -83,218 +446,240 @@ def analyze_with_openai(
     Analyze using OpenAI's API with images and/or text description.
     Returns analysis with confidence score.
     """
+    # Return the previous analysis if the same input was already analyzed
+    cache_key = build_analysis_cache_key(images_data, user_description)
+    cached_result = await get_cached_analysis(cache_key, user_id)
+    if cached_result is not None:
+        return cached_result
+    
     # Generate unique ID for this request
-    request_id = str(uuid.uuid4())[:8]
+    request_id = generate_request_id()
     
     try:
-        # Prepare the text prompt with clear instruction about confidence
-        text_prompt = f"Analyze this repair issue and provide a confidence score (0-100). User ID: {user_id}"
-        
-        if user_description and user_description.strip():
-            text_prompt += f"\n\nUser Description:\n{user_description}"
-        
-        # Add information about what was provided
-        if images_data:
-            text_prompt += f"\n\nNumber of images provided: {len(images_data)}"
-        else:
-            text_prompt += "\n\nNo images provided - analysis based on text description only."
-        
-        if not user_description or not user_description.strip():
-            text_prompt += "\n\nNo text description provided - analysis based on images only."
-        
-        # Prepare content array for OpenAI
-        content_items = [{"type": "text", "text": text_prompt}]
-        
-        # Add each image to the content (if any images provided)
-        if images_data:
-            for img_data in images_data:
-                base64_image = base64.b64encode(img_data['content']).decode('utf-8')
-                content_items.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:{img_data['mime_type']};base64,{base64_image}"
-                    }
-                })
+        model = VISION_MODEL if images_data else TEXT_MODEL
+        messages = build_messages(images_data, user_id, user_description)
+        response = await create_chat_completion(
+            model=model,
+            messages=messages,
+            max_tokens=MAX_OUTPUT_TOKENS,
+            temperature=0.1,
+            response_format={"type": "json_object"}
+        )
         
-        # Determine which model to use
-        if images_data:
-            # Use vision model if images are provided
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": SYSTEM_PROMPT
-                    },
-                    {
-                        "role": "user",
-                        "content": content_items
-                    }
-                ],
-                max_tokens=1000,
-                temperature=0.1
-            )
-        else:
-            # Use regular GPT for text-only analysis
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": SYSTEM_PROMPT
-                    },
-                    {
-                        "role": "user",
-                        "content": text_prompt
-                    }
-                ],
-                max_tokens=1000,
-                temperature=0.1
+        # Retry with a larger cap if the response was cut off mid-JSON
+        if response.choices[0].finish_reason == "length":
+            response = await create_chat_completion(
+                model=model,
+                messages=messages,
+                max_tokens=MAX_OUTPUT_TOKENS_ON_TRUNCATION,
+                temperature=0.1,
+                response_format={"type": "json_object"}
             )
         
         # Parse response
         result_text = response.choices[0].message.content
         
-        # Extract JSON from response
-        json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
-        if json_match:
-            analysis_result = json.loads(json_match.group())
-        else:
-            # Fallback: try to parse entire response as JSON
-            try:
-                analysis_result = json.loads(result_text)
-            except:
-                # Create a structured error response
-                analysis_result = {
-                    "detected_issue": "Analysis Error",
-                    "severity": "Medium Severity",
-                    "description": "Unable to parse AI response. Please try again with clearer information.",
-                    "estimated_price": {"low": 0, "high": 0},
-                    "confidence": 0
-                }
+        analysis_result, parsed = build_analysis_result(result_text, images_data, user_id, user_description, request_id)
         
-        # Validate confidence score
-        confidence = analysis_result.get("confidence", 0)
+        # Don't cache parse failures, so a retry gets a fresh analysis
+        if parsed:
+            await store_cached_analysis(cache_key, analysis_result)
+        return analysis_result
         
-        # Ensure confidence is a number between 0 and 100
-        if isinstance(confidence, str):
-            # Try to extract number from string
-            numbers = re.findall(r'\d+', confidence)
-            if numbers:
-                confidence = int(numbers[0])
-            else:
-                confidence = 50  # Default if can't parse
-        elif not isinstance(confidence, (int, float)):
-            confidence = 50
+    except Exception as e:
+        # Handle OpenAI API errors
+        return build_error_response(e, user_id, request_id)
+
+def format_sse(payload: Dict[str, Any]) -> str:
+    """
+    Format a payload as a Server-Sent Events data frame.
+    """
+    return f"data: {json.dumps(payload)}\n\n"
+
+async def stream_analysis_with_openai(
+    images_data: List[Dict[str, Any]],
+    user_id: str,
+    user_description: Optional[str] = None
+) -> AsyncIterator[str]:
+    """
+    Stream the analysis as Server-Sent Events.
+    Yields {"delta": ...} frames as tokens arrive, then one final frame with the full response envelope.
+    A {"reset": true} frame before the final frame means the streamed deltas were truncated and should be discarded.
+    """
+    # Return the previous analysis as a single final frame if the same input was already analyzed
+    cache_key = build_analysis_cache_key(images_data, user_description)
+    cached_result = await get_cached_analysis(cache_key, user_id)
+    if cached_result is not None:
+        cached_result["images_analyzed_count"] = len(images_data)
+        yield format_sse(cached_result)
+        return
+    
+    # Generate unique ID for this request
+    request_id = generate_request_id()
+    
+    try:
+        model = VISION_MODEL if images_data else TEXT_MODEL
+        messages = build_messages(images_data, user_id, user_description)
+        stream = await create_chat_completion(
+            model=model,
+            messages=messages,
+            max_tokens=MAX_OUTPUT_TOKENS,
+            temperature=0.1,
+            response_format={"type": "json_object"},
+            stream=True
+        )
         
-        # Clamp confidence between 0 and 100
-        confidence = max(0, min(100, int(confidence)))
+        # Forward tokens as they arrive and keep them for the final parse
+        chunks = []
+        finish_reason = None
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                chunks.append(delta)
+                yield format_sse({"delta": delta})
+            if chunk.choices[0].finish_reason:
+                finish_reason = chunk.choices[0].finish_reason
+        result_text = "".join(chunks)
         
-        # Build the final response
-        result_with_metadata = {
-            "user_id": user_id,
-            "detected_issue": analysis_result.get("detected_issue", "Unknown Issue"),
-            "severity": analysis_result.get("severity", "Medium Severity"),
-            "description": analysis_result.get("description", "No description provided"),
-            "estimated_price": analysis_result.get("estimated_price", {"low": 0, "high": 0}),
-            "accuracy": confidence,  # This is the confidence score
-            "success": True,
-            "request_id": request_id,
-            "analysis_timestamp": datetime.now().isoformat(),
-            "images_analyzed": len(images_data),
-            "has_user_description": user_description is not None and len(user_description.strip()) > 0
-        }
+        # The streamed response was cut off mid-JSON; fetch the full one for the final frame.
+        # Tell the client to discard the deltas, since the final frame comes from a new generation.
+        if finish_reason == "length":
+            yield format_sse({"reset": True})
+            response = await create_chat_completion(
+                model=model,
+                messages=messages,
+                max_tokens=MAX_OUTPUT_TOKENS_ON_TRUNCATION,
+                temperature=0.1,
+                response_format={"type": "json_object"}
+            )
+            result_text = response.choices[0].message.content
+        
+        analysis_result, parsed = build_analysis_result(result_text, images_data, user_id, user_description, request_id)
         
-        return result_with_metadata
+        # Don't cache parse failures, so a retry gets a fresh analysis
+        if parsed:
+            await store_cached_analysis(cache_key, analysis_result)
         
     except Exception as e:
         # Handle OpenAI API errors
-        error_msg = str(e)
-        
-        if "rate_limit" in error_msg.lower():
-            error_response = {
-                "user_id": user_id,
-                "detected_issue": "Service Error",
-                "severity": "Low Severity",
-                "description": "Rate limit exceeded. Please try again later.",
-                "estimated_price": {"low": 0, "high": 0},
-                "accuracy": 0,
-                "request_id": str(uuid.uuid4())[:8],
-                "success": False,
-                "error_message": "Rate limit exceeded"
-            }
-        elif "invalid_api_key" in error_msg.lower():
-            error_response = {
-                "user_id": user_id,
-                "detected_issue": "Service Error",
-                "severity": "Low Severity",
-                "description": "Server configuration issue. Please contact support.",
-                "estimated_price": {"low": 0, "high": 0},
-                "accuracy": 0,
-                "request_id": str(uuid.uuid4())[:8],
-                "success": False,
-                "error_message": "Authentication error"
+        analysis_result = build_error_response(e, user_id, request_id)
+    
+    # Add input info to response
+    analysis_result["images_analyzed_count"] = len(images_data)
+    
+    yield format_sse(analysis_result)
+
+def compute_digest(contents: Union[bytes, bytearray]) -> str:
+    """
+    Compute the SHA-256 digest of file contents.
+    hashlib releases the GIL on large buffers, so this runs in parallel across threads.
+    """
+    return hashlib.sha256(memoryview(contents)).hexdigest()
+
+def downscale_image(contents: Union[bytes, bytearray]) -> Optional[bytes]:
+    """
+    Downscale an image whose longest edge exceeds MAX_IMAGE_DIMENSION and re-encode it as JPEG.
+    Returns None if the image is already small enough, too large to decode safely, or cannot be decoded (e.g. SVG).
+    """
+    try:
+        with Image.open(io.BytesIO(contents)) as image:
+            if max(image.size) <= MAX_IMAGE_DIMENSION:
+                return None
+            if image.width * image.height > MAX_DOWNSCALE_PIXELS:
+                return None
+            
+            # Shrink first so the EXIF rotation below only copies the small image
+            image.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION), Image.LANCZOS)
+            
+            # Apply EXIF rotation since the re-encoded JPEG drops the orientation tag
+            image = ImageOps.exif_transpose(image)
+            
+            output = io.BytesIO()
+            image.convert("RGB").save(output, "JPEG", quality=JPEG_QUALITY, optimize=True)
+            return output.getvalue()
+    except Exception:
+        return None
+
+async def process_file(file: UploadFile) -> Tuple[str, Dict[str, Any]]:
+    """
+    Process a single uploaded file.
+    Returns ("ok", file_info) or ("err", error_info).
+    """
+    try:
+        # Reject by the known size before reading anything
+        if file.size is not None and file.size > MAX_FILE_SIZE:
+            return "err", {
+                "filename": file.filename,
+                "error": f"File too large (over {MAX_FILE_SIZE/1024/1024:.0f}MB)"
             }
-        else:
-            error_response = {
-                "user_id": user_id,
-                "detected_issue": "Analysis Failed",
-                "severity": "Low Severity",
-                "description": f"AI analysis failed: {error_msg}",
-                "estimated_price": {"low": 0, "high": 0},
-                "accuracy": 0,
-                "request_id": str(uuid.uuid4())[:8],
-                "success": False,
-                "error_message": error_msg
+        
+        # Read file content in chunks, stopping as soon as it exceeds the size limit
+        buffer = bytearray()
+        while True:
+            block = await file.read(READ_CHUNK_SIZE)
+            if not block:
+                break
+            buffer.extend(block)
+            if len(buffer) > MAX_FILE_SIZE:
+                return "err", {
+                    "filename": file.filename,
+                    "error": f"File too large (over {MAX_FILE_SIZE/1024/1024:.0f}MB)"
+                }
+        # Keep the bytearray rather than copying it to bytes; hashlib, base64 and Pillow all accept it
+        contents = buffer
+        
+        # Check if file is empty
+        if len(contents) == 0:
+            return "err", {
+                "filename": file.filename,
+                "error": "File is empty"
             }
         
-        return error_response
+        # Determine MIME type
+        file_extension = os.path.splitext(file.filename.lower())[1] if file.filename else ''
+        mime_type = determine_mime_type(file.content_type, file_extension)
+        
+        # Hash the original content (so repeated uploads can be served from cache) and
+        # downscale large images in worker threads, off the event loop and in parallel
+        digest, downscaled = await asyncio.gather(
+            asyncio.to_thread(compute_digest, contents),
+            asyncio.to_thread(downscale_image, contents)
+        )
+        if downscaled is not None:
+            contents = downscaled
+            mime_type = 'image/jpeg'
+        
+        return "ok", {
+            "filename": file.filename,
+            "content": contents,
+            "mime_type": mime_type,
+            "digest": digest,
+            "size_bytes": len(contents)
+        }
+        
+    except Exception as e:
+        return "err", {
+            "filename": file.filename,
+            "error": f"Processing error: {str(e)}"
+        }
 
 async def process_files(files: List[UploadFile]) -> Dict[str, Any]:
     """
-    Process uploaded files.
+    Process uploaded files concurrently.
     """
     processed_files = []
     errors = []
     
-    for file in files:
-        try:
-            # Read file content
-            contents = await file.read()
-            
-            # Check if file is empty
-            if len(contents) == 0:
-                errors.append({
-                    "filename": file.filename,
-                    "error": "File is empty"
-                })
-                continue
-            
-            # Check file size (max 20MB)
-            max_size = 20 * 1024 * 1024
-            if len(contents) > max_size:
-                errors.append({
-                    "filename": file.filename,
-                    "error": f"File too large ({len(contents)/1024/1024:.2f}MB)"
-                })
-                continue
-            
-            # Determine MIME type
-            file_extension = os.path.splitext(file.filename.lower())[1] if file.filename else ''
-            mime_type = determine_mime_type(file.content_type, file_extension)
-            
-            processed_files.append({
-                "filename": file.filename,
-                "content": contents,
-                "mime_type": mime_type,
-                "size_bytes": len(contents)
-            })
-            
-        except Exception as e:
-            errors.append({
-                "filename": file.filename,
-                "error": f"Processing error: {str(e)}"
-            })
+    # Read all files at once instead of one after another
+    results = await asyncio.gather(*(process_file(file) for file in files))
+    
+    for status, info in results:
+        if status == "ok":
+            processed_files.append(info)
+        else:
+            errors.append(info)
     
     return {
         "processed_files": processed_files,
@@ -367,7 +752,7 @@ async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": format_timestamp(time.time()),
         "service": "fixme-ai",
         "openai_status": "configured" if os.getenv('OPENAI_API_KEY') else "not_configured"
     }
@@ -376,7 +761,8 @@ async def health_check():
 async def analyze_issues(
     user_id: str = Form(..., description="Unique identifier for the user"),
     description: Optional[str] = Form(None, description="Optional text description of the issue"),
-    files: Optional[List[UploadFile]] = File(None, description="Optional list of image files")
+    files: Optional[List[UploadFile]] = File(None, description="Optional list of image files"),
+    stream: bool = Form(False, description="Stream the analysis as Server-Sent Events")
 ):
     """
     Analyze repair issues using images and/or text description
@@ -385,9 +771,11 @@ async def analyze_issues(
         user_id: Unique identifier for the user (required)
         description: Optional text description of the issue
         files: Optional list of image files (up to 10 images)
+        stream: If true, stream the analysis as Server-Sent Events
     
     Returns:
-        JSON response with analysis results including accuracy score (0-100)
+        JSON response with analysis results including accuracy score (0-100),
+        or a text/event-stream of token deltas followed by the same JSON envelope
     """
     # Validate user_id
     if not user_id or not user_id.strip():
@@ -431,7 +819,7 @@ async def analyze_issues(
     images_data = []
     if has_images:
         # Check number of images
-        if len(files) > 10:
+        if len(files) > MAX_IMAGES:
             raise HTTPException(
                 status_code=400,
                 detail={
@@ -459,11 +847,23 @@ async def analyze_issues(
         for processed_file in processing_result["processed_files"]:
             images_data.append({
                 "content": processed_file["content"],
-                "mime_type": processed_file["mime_type"]
+                "mime_type": processed_file["mime_type"],
+                "digest": processed_file["digest"]
             })
     
+    # Stream tokens to the client as they are generated
+    if stream:
+        return StreamingResponse(
+            stream_analysis_with_openai(
+                images_data=images_data,
+                user_id=user_id,
+                user_description=description if has_description else None
+            ),
+            media_type="text/event-stream"
+        )
+    
     # Call the AI analysis function
-    analysis_result = analyze_with_openai(
+    analysis_result = await analyze_with_openai(
         images_data=images_data,
         user_id=user_id,
         user_description=description if has_description else None
@@ -500,8 +900,11 @@ async def http_exception_handler(request, exc):
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
-        app, 
+        "main:app", 
         host="0.0.0.0", 
         port=8003,
+        workers=int(os.getenv('WEB_CONCURRENCY', os.cpu_count() or 1)),
+        loop="auto",  # uvloop when installed (not available on Windows)
+        http="httptools",
         log_level="info"
     )
\ No newline at end of file